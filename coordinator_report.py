@@ -0,0 +1,11 @@
+# Structured report schema for the AI Legal Document Analyzer
+# Kept outside the Streamlit script so the class is created once per process rather than on every rerun
+from typing import List
+from pydantic import BaseModel, Field
+
+
+# Structured report returned by the Analysis Coordinator
+class CoordinatorReport(BaseModel):
+    analysis: str = Field(..., description="Detailed legal analysis report in markdown.")
+    key_points: List[str] = Field(..., description="Exactly 5 key legal points.")
+    recommendations: List[str] = Field(..., description="Exactly 3 specific legal recommendations.")
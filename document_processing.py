@@ -0,0 +1,135 @@
+# Document processing helpers for the AI Legal Document Analyzer
+import io
+import os
+import sys
+import multiprocessing
+import numpy as np
+import pypdf
+from agno.document.base import Document
+from agno.document.chunking.strategy import ChunkingStrategy
+
+# Documents with more pages than this are extracted on a process pool; smaller ones skip the fork overhead
+PARALLEL_EXTRACTION_MIN_PAGES = 50
+
+# Pages handed to a pool worker per task
+EXTRACTION_BATCH_SIZE = 10
+
+# Characters of chunked text buffered before a batch is handed to the knowledge base
+INGEST_BUFFER_SIZE = 1024 * 1024
+
+# PDF reader owned by each pool worker, opened once by the pool initializer
+_worker_pdf_reader = None
+
+
+# Chunking strategy that cuts text at a fixed stride, with every chunk offset computed up front by NumPy
+class StrideChunking(ChunkingStrategy):
+    def __init__(self, chunk_size=5000, overlap=0):
+        self.chunk_size = chunk_size
+        # The sidebar allows an overlap at or above the chunk size; capping it at half a chunk keeps every
+        # character in at most two chunks instead of one full-size chunk per character
+        self.overlap = min(overlap, chunk_size // 2)
+        self.stride = chunk_size - self.overlap
+
+    def chunk(self, document):
+        content = self.clean_text(document.content or "")
+        if not content:
+            return []
+
+        # Stop before a final chunk that would only repeat the previous chunk's overlap
+        chunk_starts = np.arange(0, max(len(content) - self.overlap, 1), self.stride).tolist()
+
+        chunked_documents = []
+        for chunk_number, chunk_start in enumerate(chunk_starts, start=1):
+            chunk_content = content[chunk_start:chunk_start + self.chunk_size]
+
+            meta_data = document.meta_data.copy()
+            meta_data["chunk"] = chunk_number
+            meta_data["chunk_size"] = len(chunk_content)
+
+            chunk_id = None
+            if document.id:
+                chunk_id = f"{document.id}_{chunk_number}"
+            elif document.name:
+                chunk_id = f"{document.name}_{chunk_number}"
+
+            chunked_documents.append(
+                Document(
+                    id=chunk_id,
+                    name=document.name,
+                    meta_data=meta_data,
+                    content=chunk_content
+                )
+            )
+
+        return chunked_documents
+
+
+def _init_extraction_worker(pdf_bytes):
+    global _worker_pdf_reader
+    _worker_pdf_reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+
+
+def _extract_page(page_index):
+    return page_index, _worker_pdf_reader.pages[page_index].extract_text() or ""
+
+
+# Function to pick a pool start method that does not re-run the Streamlit script in every worker
+def _extraction_context():
+    # Streamlit registers the running script as __main__, so "spawn" workers would execute the whole app again;
+    # fork is only safe on Linux (macOS system frameworks crash in forked children), elsewhere extraction stays in-process
+    if sys.platform.startswith("linux") and "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+
+# Function to yield (page number, text) for every page, spreading large documents across CPU cores
+def iter_page_texts(pdf_bytes):
+    pdf_reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+    page_count = len(pdf_reader.pages)
+    process_count = min(page_count, os.cpu_count() or 1)
+    extraction_context = _extraction_context()
+
+    if page_count <= PARALLEL_EXTRACTION_MIN_PAGES or process_count < 2 or extraction_context is None:
+        for page_index, page in enumerate(pdf_reader.pages):
+            yield page_index + 1, page.extract_text() or ""
+        return
+
+    with extraction_context.Pool(
+        process_count,
+        initializer=_init_extraction_worker,
+        initargs=(pdf_bytes,)
+    ) as extraction_pool:
+        # Submit pages one window at a time so extracted text cannot pile up faster than it is ingested
+        window_size = process_count * EXTRACTION_BATCH_SIZE
+        for window_start in range(0, page_count, window_size):
+            window_pages = range(window_start, min(window_start + window_size, page_count))
+            for page_index, page_text in extraction_pool.imap_unordered(
+                _extract_page, window_pages, chunksize=EXTRACTION_BATCH_SIZE
+            ):
+                yield page_index + 1, page_text
+
+
+# Function to stream a PDF as batches of chunked documents, one source document per page as Agno's PDFReader does
+def iter_pdf_document_batches(pdf_bytes, document_name, chunking_strategy, buffer_size=INGEST_BUFFER_SIZE):
+    document_batch = []
+    buffered_characters = 0
+
+    for page_number, page_text in iter_page_texts(pdf_bytes):
+        page_document = Document(
+            name=document_name,
+            id=f"{document_name}_{page_number}",
+            meta_data={"page": page_number},
+            content=page_text
+        )
+        for chunked_document in chunking_strategy.chunk(page_document):
+            document_batch.append(chunked_document)
+            buffered_characters += len(chunked_document.content)
+
+        # Hand off a batch once the buffer fills so only a bounded slice of the document is held in memory
+        if buffered_characters >= buffer_size:
+            yield document_batch
+            document_batch = []
+            buffered_characters = 0
+
+    if document_batch:
+        yield document_batch
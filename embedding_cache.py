@@ -0,0 +1,113 @@
+# Disk-backed embedding cache for the AI Legal Document Analyzer
+import os
+import hashlib
+import sqlite3
+import threading
+from dataclasses import dataclass
+import numpy as np
+from agno.embedder.openai import OpenAIEmbedder
+
+# Texts sent to OpenAI per embeddings request when filling cache misses
+EMBEDDING_REQUEST_BATCH_SIZE = 256
+
+# SQLite limits the number of bound parameters per statement, so lookups are split into groups this size
+CACHE_LOOKUP_BATCH_SIZE = 500
+
+# Vectors kept on disk before the oldest are evicted; about 150 MB at 1536 float16 dimensions
+MAX_CACHE_ENTRIES = 50000
+
+
+# OpenAI embedder that looks every text up in a SQLite cache keyed by content hash before calling the API
+@dataclass
+class CachedOpenAIEmbedder(OpenAIEmbedder):
+    cache_path: str = "tmp/embedding_cache.db"
+    max_cache_entries: int = MAX_CACHE_ENTRIES
+
+    def __post_init__(self):
+        if hasattr(super(), "__post_init__"):
+            super().__post_init__()
+        # Knowledge base loading and analysis run on different threads, so access is serialized by a lock
+        self._cache_lock = threading.Lock()
+        self._cache_connection = None
+
+    # Opened on first use; callers must hold the cache lock
+    @property
+    def cache_connection(self):
+        if self._cache_connection is None:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            self._cache_connection = sqlite3.connect(self.cache_path, check_same_thread=False)
+            self._cache_connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+        return self._cache_connection
+
+    def _cache_key(self, text):
+        # The model and dimensions are part of the key so vectors from different configurations never mix
+        return hashlib.sha256(f"{self.id}:{self.dimensions}\n{text}".encode()).digest()
+
+    def _load_cached(self, cache_keys):
+        cached_vectors = {}
+        with self._cache_lock:
+            connection = self.cache_connection
+            for batch_start in range(0, len(cache_keys), CACHE_LOOKUP_BATCH_SIZE):
+                key_batch = cache_keys[batch_start:batch_start + CACHE_LOOKUP_BATCH_SIZE]
+                rows = connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({', '.join('?' * len(key_batch))})",
+                    key_batch
+                )
+                for cache_key, vector_bytes in rows:
+                    cached_vectors[cache_key] = np.frombuffer(vector_bytes, dtype=np.float16).astype(np.float32).tolist()
+        return cached_vectors
+
+    def _store_cached(self, cache_entries):
+        with self._cache_lock:
+            connection = self.cache_connection
+            # Stored as float16 to halve the on-disk footprint
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [
+                    (cache_key, np.asarray(embedding, dtype=np.float16).tobytes())
+                    for cache_key, embedding in cache_entries
+                ]
+            )
+
+            # Evict the oldest entries past the size bound; a replaced row gets a new rowid, so rowid order is insertion order
+            entry_count = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if entry_count > self.max_cache_entries:
+                connection.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+                    (entry_count - self.max_cache_entries,)
+                )
+            connection.commit()
+
+    def _request_embeddings(self, texts):
+        # OpenAIEmbedder.response builds the request parameters and passes the input through, so it embeds a list as well
+        embedding_response = self.response(texts)
+        return [item.embedding for item in sorted(embedding_response.data, key=lambda item: item.index)]
+
+    def get_embeddings(self, texts):
+        cache_keys = [self._cache_key(text) for text in texts]
+        embeddings_by_key = self._load_cached(cache_keys)
+
+        # Embed each distinct missing text once, batching the misses into as few requests as possible
+        missing_texts = {}
+        for cache_key, text in zip(cache_keys, texts):
+            if cache_key not in embeddings_by_key:
+                missing_texts.setdefault(cache_key, text)
+
+        missing_items = list(missing_texts.items())
+        for batch_start in range(0, len(missing_items), EMBEDDING_REQUEST_BATCH_SIZE):
+            item_batch = missing_items[batch_start:batch_start + EMBEDDING_REQUEST_BATCH_SIZE]
+            new_embeddings = self._request_embeddings([text for _, text in item_batch])
+            new_entries = [(cache_key, embedding) for (cache_key, _), embedding in zip(item_batch, new_embeddings)]
+            self._store_cached(new_entries)
+            embeddings_by_key.update(new_entries)
+
+        return [embeddings_by_key[cache_key] for cache_key in cache_keys]
+
+    def get_embedding(self, text):
+        return self.get_embeddings([text])[0]
+
+    def get_embedding_and_usage(self, text):
+        # Usage is not tracked for cached lookups
+        return self.get_embedding(text), None
@@ -1,14 +1,27 @@
 # AI-Powered Legal Document Analysis System
 import os
+import io
+import hashlib
+import string
+import uuid
+import weakref
+from collections import OrderedDict, deque
+import httpx
+import numpy as np
+import tiktoken
 import streamlit as st
-import tempfile
+from pydantic import BaseModel, ValidationError
+from concurrent.futures import ThreadPoolExecutor
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
-from agno.embedder.openai import OpenAIEmbedder
 from agno.tools.duckduckgo import DuckDuckGoTools
-from agno.knowledge.pdf import PDFKnowledgeBase, PDFReader
+from agno.knowledge.pdf import PDFKnowledgeBase
 from agno.vectordb.chroma import ChromaDb
-from agno.document.chunking.document import DocumentChunking
+import pypdf
+from document_processing import StrideChunking, iter_pdf_document_batches
+from embedding_cache import CachedOpenAIEmbedder
+from coordinator_report import CoordinatorReport
+from literal_lookup import find_literal_matches
 
 # Configure Streamlit application
 st.set_page_config(
@@ -32,20 +45,204 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
-# Initialize application state
-if "vector_database" not in st.session_state:
-    st.session_state.vector_database = ChromaDb(
-        collection="legal_docs", 
-        path="tmp/chromadb", 
-        persistent_client=True, 
-        embedder=OpenAIEmbedder()
-    )
+# Semantic cache mapping analysis queries to finished reports, bucketed by random-projection LSH
+class SemanticCache:
+    def __init__(self, hyperplane_count=8, similarity_threshold=0.95, max_entries_per_scope=32):
+        self.hyperplane_count = hyperplane_count
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_scope = max_entries_per_scope
+        # Hyperplanes are drawn once per cache so bucket keys stay stable for the whole session
+        self.projection_matrix = None
+        self.buckets = {}
+        # Bucket key of every entry per scope, oldest first
+        self.scope_history = {}
+
+    def _bucket_key(self, query_embedding):
+        if self.projection_matrix is None:
+            self.projection_matrix = np.random.default_rng().standard_normal(
+                (self.hyperplane_count, query_embedding.shape[0])
+            )
+        projection_bits = (self.projection_matrix @ query_embedding) > 0
+        return int(projection_bits @ (1 << np.arange(self.hyperplane_count)))
+
+    def _candidate_keys(self, bucket_key):
+        # The bucket itself plus every bucket at Hamming distance one
+        return [bucket_key] + [bucket_key ^ (1 << bit) for bit in range(self.hyperplane_count)]
+
+    def lookup(self, scope, query_embedding):
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        candidate_buckets = [
+            self.buckets[(scope, candidate_key)]
+            for candidate_key in self._candidate_keys(self._bucket_key(query_embedding))
+            if (scope, candidate_key) in self.buckets
+        ]
+        if not candidate_buckets:
+            return None
+
+        # Rows are unit-normalized at insert, so one matrix-vector product yields every cosine similarity;
+        # stored rows are float16 and are up-cast so accumulation stays in float32
+        candidate_matrix = np.concatenate([bucket["embeddings"] for bucket in candidate_buckets])
+        candidate_reports = [report for bucket in candidate_buckets for report in bucket["reports"]]
+        similarities = candidate_matrix.astype(np.float32) @ (query_embedding / np.linalg.norm(query_embedding))
+
+        best_index = int(np.argmax(similarities))
+        if similarities[best_index] >= self.similarity_threshold:
+            return candidate_reports[best_index]
+        return None
+
+    def insert(self, scope, query_embedding, report):
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        bucket_key = self._bucket_key(query_embedding)
+        # Keep the stored copy unit-normalized and in float16: half the memory, and cosine similarity is essentially unchanged
+        normalized_embedding = (query_embedding / np.linalg.norm(query_embedding)).astype(np.float16)
+
+        bucket = self.buckets.setdefault(
+            (scope, bucket_key),
+            {"embeddings": np.empty((0, query_embedding.shape[0]), dtype=np.float16), "reports": []}
+        )
+        bucket["embeddings"] = np.vstack([bucket["embeddings"], normalized_embedding])
+        bucket["reports"].append(report)
 
+        # Evict the scope's oldest entries past the cap; entries are appended in order, so the oldest
+        # entry of a scope is always the first row of its bucket
+        scope_history = self.scope_history.setdefault(scope, deque())
+        scope_history.append(bucket_key)
+        while len(scope_history) > self.max_entries_per_scope:
+            oldest_bucket = self.buckets[(scope, scope_history.popleft())]
+            oldest_bucket["embeddings"] = oldest_bucket["embeddings"][1:]
+            del oldest_bucket["reports"][0]
+            if not oldest_bucket["reports"]:
+                self.buckets = {bucket: entries for bucket, entries in self.buckets.items() if entries is not oldest_bucket}
+
+    def discard_scope(self, scope):
+        self.buckets = {bucket: entries for bucket, entries in self.buckets.items() if bucket[0] != scope}
+        self.scope_history.pop(scope, None)
+
+# Mapping that evicts its least recently used entry once it grows past maxsize
+class LRUDict(OrderedDict):
+    def __init__(self, maxsize, on_evict=None):
+        super().__init__()
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            evicted_key, evicted_value = self.popitem(last=False)
+            if self.on_evict:
+                self.on_evict(evicted_key, evicted_value)
+
+    def touch(self, key):
+        self.move_to_end(key)
+
+# Documents remembered per session, and knowledge bases kept per process
+MAX_CACHED_DOCUMENTS = 8
+
+# Initialize application state
 if "document_knowledge_base" not in st.session_state:
     st.session_state.document_knowledge_base = None
 
+# Content hash of the document currently backing the knowledge base
+if "active_document_hash" not in st.session_state:
+    st.session_state.active_document_hash = None
+
+if "semantic_cache" not in st.session_state:
+    st.session_state.semantic_cache = SemanticCache()
+
+# Build inputs of the session's knowledge base, so reruns only call the builder when one of them changes
+if "knowledge_base_key" not in st.session_state:
+    st.session_state.knowledge_base_key = None
+
+# Chunking settings each processed document's cached reports were built under
+if "document_chunk_settings" not in st.session_state:
+    st.session_state.document_chunk_settings = {}
+
+# Function to drop per-document session state when a document falls out of the processed-documents LRU
+def forget_document(document_hash, document_name):
+    st.session_state.semantic_cache.discard_scope(document_hash)
+    st.session_state.document_chunk_settings.pop(document_hash, None)
+
+# Processed documents keyed by SHA-256 of their content, mapped to the uploaded filename
 if "processed_documents" not in st.session_state:
-    st.session_state.processed_documents = set()
+    st.session_state.processed_documents = LRUDict(MAX_CACHED_DOCUMENTS, on_evict=forget_document)
+
+# Function to create the HTTP client shared by every OpenAI call, so pooled connections and TLS sessions are reused
+@st.cache_resource(show_spinner=False)
+def get_http_client():
+    return httpx.Client(
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+        timeout=60
+    )
+
+# Function to create the embedder shared by knowledge bases and query lookups, one per API key;
+# embeddings are cached on disk so boilerplate shared across documents is only embedded once
+@st.cache_resource(show_spinner=False)
+def get_embedder(api_key):
+    return CachedOpenAIEmbedder(
+        api_key=api_key,
+        client_params={"http_client": get_http_client()}
+    )
+
+# Function to build a knowledge base for a document, cached by content hash, chunking settings and API key
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_DOCUMENTS)
+def build_document_knowledge_base(document_hash, _pdf_bytes, chunk_size, overlap, api_key):
+    # Vectors are kept in an in-memory collection owned by this knowledge base alone; rebuilding after a
+    # restart is cheap because the embeddings themselves are cached on disk
+    document_knowledge_base = PDFKnowledgeBase(
+        vector_db=ChromaDb(
+            collection=f"legal_docs_{document_hash[:16]}_{uuid.uuid4().hex[:16]}",
+            embedder=get_embedder(api_key)
+        ),
+        chunking_strategy=StrideChunking(
+            chunk_size=chunk_size,
+            overlap=overlap
+        )
+    )
+
+    # Drop the collection once the cache has evicted this knowledge base and no session still holds it
+    weakref.finalize(document_knowledge_base, document_knowledge_base.vector_db.drop)
+
+    # Create the collection up front: a scanned PDF yields no batches, and lookups still need a collection to query
+    document_knowledge_base.vector_db.create()
+
+    # Stream the document into the knowledge base batch by batch; chunk ids are content hashes, so upserts are idempotent
+    for document_batch in iter_pdf_document_batches(
+        _pdf_bytes, document_hash[:16], document_knowledge_base.chunking_strategy
+    ):
+        # Fill embedding cache misses for the whole batch in bulk; the per-chunk upsert then reads from the cache
+        document_knowledge_base.vector_db.embedder.get_embeddings([document.content for document in document_batch])
+        document_knowledge_base.load_documents(document_batch, upsert=True)
+
+    return document_knowledge_base
+
+# Function to make a document's knowledge base the active one; the builder's cache is shared by every session,
+# so it is only consulted when the document, chunking settings or API key change, and the session's own
+# reference keeps its knowledge base alive in between
+def activate_knowledge_base(document_hash, pdf_bytes, chunk_size, overlap, api_key):
+    knowledge_base_key = (document_hash, chunk_size, overlap, api_key)
+    if st.session_state.knowledge_base_key == knowledge_base_key:
+        return
+
+    st.session_state.document_knowledge_base = build_document_knowledge_base(
+        document_hash, pdf_bytes, chunk_size, overlap, api_key
+    )
+    st.session_state.active_document_hash = document_hash
+    st.session_state.knowledge_base_key = knowledge_base_key
+
+    # Reports cached under other chunking settings were built from different excerpts
+    if st.session_state.document_chunk_settings.get(document_hash, (chunk_size, overlap)) != (chunk_size, overlap):
+        st.session_state.semantic_cache.discard_scope(document_hash)
+    st.session_state.document_chunk_settings[document_hash] = (chunk_size, overlap)
+
+# Function to read the page count and first-page text for the upload preview, cached by content hash
+@st.cache_data(show_spinner=False, max_entries=MAX_CACHED_DOCUMENTS)
+def extract_document_preview(document_hash, _pdf_bytes):
+    pdf_reader = pypdf.PdfReader(io.BytesIO(_pdf_bytes))
+    page_count = len(pdf_reader.pages)
+    # pypdf parses page content lazily, so only the first page is ever extracted here
+    first_page_text = (pdf_reader.pages[0].extract_text() or "") if page_count > 0 else ""
+    return page_count, first_page_text
 
 # Sidebar configuration and document management
 with st.sidebar:
@@ -80,6 +277,8 @@ with st.sidebar:
         max_value=1000, 
         value=200
     )
+    if overlap_parameter > chunk_size_parameter // 2:
+        st.sidebar.warning(f"⚠️ Chunk overlap is capped at half the chunk size ({chunk_size_parameter // 2}).")
 
     # Document upload section
     st.header("📄 Document Management")
@@ -90,27 +289,20 @@ with st.sidebar:
     )
     
     if uploaded_document:
-        if uploaded_document.name not in st.session_state.processed_documents:
+        pdf_bytes = uploaded_document.getvalue()
+        document_hash = hashlib.sha256(pdf_bytes).hexdigest()
+
+        if document_hash not in st.session_state.processed_documents:
             with st.spinner("Processing document..."):
                 try:
-                    # Create temporary file for processing
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-                        temp_file.write(uploaded_document.getvalue())
-                        temp_file_path = temp_file.name
-                    
-                    # Initialize knowledge base with uploaded document
-                    st.session_state.document_knowledge_base = PDFKnowledgeBase(
-                        path=temp_file_path,
-                        vector_db=st.session_state.vector_database,
-                        reader=PDFReader(),
-                        chunking_strategy=DocumentChunking(
-                            chunk_size=chunk_size_parameter, 
-                            overlap=overlap_parameter
-                        )
+                    # Initialize knowledge base with uploaded document (served from cache for repeat content)
+                    activate_knowledge_base(
+                        document_hash,
+                        pdf_bytes,
+                        chunk_size_parameter,
+                        overlap_parameter,
+                        os.environ.get("OPENAI_API_KEY")
                     )
-
-                    # Load document into knowledge base
-                    st.session_state.document_knowledge_base.load(recreate=True, upsert=True)
                     
                     # Verify knowledge base functionality
                     try:
@@ -123,9 +315,12 @@ with st.sidebar:
                     except Exception as verification_error:
                         st.error(f"❌ Knowledge base verification failed: {verification_error}")
                     
-                    st.session_state.processed_documents.add(uploaded_document.name)
+                    st.session_state.processed_documents[document_hash] = uploaded_document.name
 
-                    st.success("✅ Document processed and stored in knowledge base!")
+                    if st.session_state.document_knowledge_base.vector_db.get_count() == 0:
+                        st.warning("⚠️ No extractable text found in this document. Scanned PDFs need OCR before they can be analyzed.")
+                    else:
+                        st.success("✅ Document processed and stored in knowledge base!")
                     
                     # Display document information
                     st.info(f"📊 Document Details: {uploaded_document.name} ({uploaded_document.size} bytes)")
@@ -173,128 +368,258 @@ with st.sidebar:
                     
                     # Document content preview
                     try:
-                        import pypdf
-                        with open(temp_file_path, 'rb') as file:
-                            pdf_reader = pypdf.PdfReader(file)
-                            page_count = len(pdf_reader.pages)
+                        with st.expander("📝 Preview", expanded=False):
+                            page_count, first_page_text = extract_document_preview(document_hash, pdf_bytes)
                             st.info(f"📄 PDF Pages: {page_count}")
                             
                             # First page preview
                             if page_count > 0:
-                                first_page_content = pdf_reader.pages[0]
-                                text_preview = first_page_content.extract_text()[:200] + "..." if len(first_page_content.extract_text()) > 200 else first_page_content.extract_text()
+                                text_preview = first_page_text[:200] + ("..." if len(first_page_text) > 200 else "")
                                 st.text_area("📝 First Page Preview:", text_preview, height=100, disabled=True)
                     except Exception as preview_error:
                         st.warning(f"Could not preview PDF content: {preview_error}")
 
                 except Exception as processing_error:
                     st.error(f"Error processing document: {processing_error}")
+
+        else:
+            # Re-bind the active knowledge base; a plain rerun with unchanged settings returns immediately
+            with st.spinner("Loading document..."):
+                try:
+                    activate_knowledge_base(
+                        document_hash,
+                        pdf_bytes,
+                        chunk_size_parameter,
+                        overlap_parameter,
+                        os.environ.get("OPENAI_API_KEY")
+                    )
+                    st.session_state.processed_documents.touch(document_hash)
+                except Exception as processing_error:
+                    st.error(f"Error processing document: {processing_error}")
                     
-# Function to initialize AI agents with current knowledge base
-def initialize_ai_agents():
-    if st.session_state.document_knowledge_base:
-        # Verify knowledge base status
-        try:
-            knowledge_base_test = st.session_state.document_knowledge_base.search("test")
-            st.info(f"🔍 Knowledge base search test: Found {len(knowledge_base_test) if knowledge_base_test else 0} results")
-        except Exception as knowledge_base_error:
-            st.error(f"❌ Knowledge base search failed: {knowledge_base_error}")
-        
-        # Initialize Legal Advisor agent
-        legal_advisor_agent = Agent(
-            name="LegalAdvisor",
-            model=OpenAIChat(id="gpt-4o-mini"),
-            knowledge=st.session_state.document_knowledge_base,
-            search_knowledge=True,
-            description="AI Legal Advisor - Discovers and references relevant legal cases, regulations, and precedents using comprehensive document data.",
-            instructions=[
-                "IMPORTANT: You have access to a knowledge base containing the uploaded legal document. Use search_knowledge=True to access this content.",
-                "First, search the knowledge base for the document content using relevant keywords.",
-                "Extract all available data from the knowledge base and search for legal cases, regulations, and citations.",
-                "If needed, use DuckDuckGo for additional legal references.",
-                "Always provide source references in your answers.",
-                "If you cannot find content, explicitly state what you searched for and what was found."
-            ],  
-            tools=[DuckDuckGoTools()],
-            show_tool_calls=True,
-            markdown=True
-        )
+# Chat model used by every agent; only its HTTP client is shared between sessions
+AGENT_MODEL_ID = "gpt-4o-mini"
 
-        # Initialize Contract Examiner agent
-        contract_examiner_agent = Agent(
-            name="ContractExaminer",
-            model=OpenAIChat(id="gpt-4o-mini"),
-            knowledge=st.session_state.document_knowledge_base,
-            search_knowledge=True,
-            description="AI Contract Examiner - Reviews contracts and identifies key clauses, risks, and obligations using comprehensive document data.",
-            instructions=[
-                "IMPORTANT: You have access to a knowledge base containing the uploaded legal document. Use search_knowledge=True to access this content.",
-                "First, search the knowledge base for the document content using relevant keywords like 'contract', 'agreement', 'terms', 'clauses'.",
-                "Extract all available data from the knowledge base and analyze the contract for key clauses, obligations, and potential ambiguities.",
-                "Reference specific sections of the contract where possible.",
-                "If you cannot find content, explicitly state what you searched for and what was found."
-            ],
-            show_tool_calls=True,
-            markdown=True
-        )
+# Function to initialize AI agents for one analysis; agents keep their run history in memory, so they are
+# built fresh for each analysis instead of being shared between sessions
+def build_agents(api_key):
+    # Initialize Legal Advisor agent
+    legal_advisor_agent = Agent(
+        name="LegalAdvisor",
+        model=OpenAIChat(id=AGENT_MODEL_ID, api_key=api_key, http_client=get_http_client()),
+        search_knowledge=False,
+        description="AI Legal Advisor - Discovers and references relevant legal cases, regulations, and precedents using comprehensive document data.",
+        instructions=[
+            "IMPORTANT: Each request includes excerpts retrieved from the uploaded legal document. Base your answer on these excerpts.",
+            "Extract all available data from the excerpts and search for legal cases, regulations, and citations.",
+            "If needed, use DuckDuckGo for additional legal references.",
+            "Always provide source references in your answers.",
+            "If the excerpts do not cover the question, explicitly state what is missing."
+        ],  
+        tools=[DuckDuckGoTools()],
+        show_tool_calls=True
+    )
 
-        # Initialize Risk Assessor agent
-        risk_assessor_agent = Agent(
-            name="RiskAssessor",
-            model=OpenAIChat(id="gpt-4o-mini"),
-            knowledge=st.session_state.document_knowledge_base,
-            search_knowledge=True,
-            description="AI Risk Assessor - Provides comprehensive risk assessment and strategic recommendations based on comprehensive contract data.",
-            instructions=[
-                "IMPORTANT: You have access to a knowledge base containing the uploaded legal document. Use search_knowledge=True to access this content.",
-                "First, search the knowledge base for the document content using relevant keywords like 'risk', 'liability', 'obligation', 'compliance'.",
-                "Using all data from the knowledge base, assess the contract for legal risks and opportunities.",
-                "Provide actionable recommendations and ensure compliance with applicable laws.",
-                "If you cannot find content, explicitly state what you searched for and what was found."
-            ],
-            show_tool_calls=True,
-            markdown=True
-        )
+    # Initialize Contract Examiner agent
+    contract_examiner_agent = Agent(
+        name="ContractExaminer",
+        model=OpenAIChat(id=AGENT_MODEL_ID, api_key=api_key, http_client=get_http_client()),
+        search_knowledge=False,
+        description="AI Contract Examiner - Reviews contracts and identifies key clauses, risks, and obligations using comprehensive document data.",
+        instructions=[
+            "IMPORTANT: Each request includes excerpts retrieved from the uploaded legal document. Base your answer on these excerpts.",
+            "Extract all available data from the excerpts and analyze the contract for key clauses, obligations, and potential ambiguities.",
+            "Reference specific sections of the contract where possible.",
+            "If the excerpts do not cover the question, explicitly state what is missing."
+        ],
+        show_tool_calls=True
+    )
 
-        # Initialize Analysis Coordinator agent
-        analysis_coordinator_agent = Agent(
-            name="AnalysisCoordinator",
-            model=OpenAIChat(id="gpt-4o-mini"),
-            description="AI Analysis Coordinator - Integrates responses from the Legal Advisor, Contract Examiner, and Risk Assessor into a comprehensive report.",
-            instructions=[
-                "Combine and summarize all insights provided by the Legal Advisor, Contract Examiner, and Risk Assessor. "
-                "Ensure the final report includes references to all relevant sections from the document."
-            ],
-            show_tool_calls=True,
-            markdown=True
-        )
+    # Initialize Risk Assessor agent
+    risk_assessor_agent = Agent(
+        name="RiskAssessor",
+        model=OpenAIChat(id=AGENT_MODEL_ID, api_key=api_key, http_client=get_http_client()),
+        search_knowledge=False,
+        description="AI Risk Assessor - Provides comprehensive risk assessment and strategic recommendations based on comprehensive contract data.",
+        instructions=[
+            "IMPORTANT: Each request includes excerpts retrieved from the uploaded legal document. Base your answer on these excerpts.",
+            "Using all data from the excerpts, assess the contract for legal risks and opportunities.",
+            "Provide actionable recommendations and ensure compliance with applicable laws.",
+            "If the excerpts do not cover the question, explicitly state what is missing."
+        ],
+        show_tool_calls=True
+    )
+
+    # Initialize Analysis Coordinator agent; its reply is constrained to the CoordinatorReport JSON schema
+    analysis_coordinator_agent = Agent(
+        name="AnalysisCoordinator",
+        model=OpenAIChat(id=AGENT_MODEL_ID, api_key=api_key, http_client=get_http_client()),
+        response_model=CoordinatorReport,
+        structured_outputs=True,
+        description="AI Analysis Coordinator - Integrates responses from the Legal Advisor, Contract Examiner, and Risk Assessor into a comprehensive report.",
+        instructions=[
+            "Combine and summarize all insights provided by the Legal Advisor, Contract Examiner, and Risk Assessor. "
+            "Ensure the final report includes references to all relevant sections from the document."
+        ],
+        show_tool_calls=True
+    )
+
+    return legal_advisor_agent, contract_examiner_agent, risk_assessor_agent, analysis_coordinator_agent
 
-        return legal_advisor_agent, contract_examiner_agent, risk_assessor_agent, analysis_coordinator_agent
-    return None, None, None, None
+# Document chunks retrieved per specialist query for the shared context
+SHARED_CONTEXT_RESULTS_PER_QUERY = 8
+
+# Function to retrieve document excerpts for every specialist with one embedding batch and one vector query
+def retrieve_shared_context(knowledge_base, retrieval_queries, results_per_query=SHARED_CONTEXT_RESULTS_PER_QUERY):
+    vector_database = knowledge_base.vector_db
+    query_embeddings = vector_database.embedder.get_embeddings(retrieval_queries)
+
+    # Chroma answers every query embedding in a single call
+    document_collection = vector_database.client.get_collection(name=vector_database.collection_name)
+    query_results = document_collection.query(
+        query_embeddings=query_embeddings,
+        n_results=results_per_query,
+        include=["documents", "metadatas", "distances"]
+    )
+
+    # Merge the hits from all queries, keeping each chunk once at its best distance
+    best_hits = {}
+    for chunk_ids, chunk_contents, chunk_metadatas, chunk_distances in zip(
+        query_results["ids"], query_results["documents"], query_results["metadatas"], query_results["distances"]
+    ):
+        for chunk_id, chunk_content, chunk_metadata, chunk_distance in zip(
+            chunk_ids, chunk_contents, chunk_metadatas, chunk_distances
+        ):
+            if chunk_id not in best_hits or chunk_distance < best_hits[chunk_id][0]:
+                best_hits[chunk_id] = (chunk_distance, chunk_content, chunk_metadata or {})
+
+    return "\n\n".join(
+        f"[Page {chunk_metadata.get('page', '?')}] {chunk_content}"
+        for _, chunk_content, chunk_metadata in sorted(best_hits.values(), key=lambda hit: hit[0])
+    )
+
+# Tokens of each specialist agent's output forwarded to the coordinator
+AGENT_OUTPUT_TOKEN_LIMIT = 400
+
+# Prompt sent to the Analysis Coordinator; specialist output is substituted in already clipped
+COORDINATOR_PROMPT_TEMPLATE = string.Template(
+    "Create a concise legal analysis report covering:\n"
+    "1. Key findings from research\n"
+    "2. Contract analysis highlights\n"
+    "3. Risk assessment summary\n"
+    "4. Strategic recommendations\n\n"
+    "Research: $research...\n"
+    "Contract: $contract...\n"
+    "Strategy: $strategy..."
+)
+
+# Function to load the tokenizer used to clip agent output, built once per process
+@st.cache_resource(show_spinner=False)
+def get_token_encoder():
+    return tiktoken.encoding_for_model(AGENT_MODEL_ID)
+
+# Function to clip text to a token budget so the coordinator prompt has a predictable length
+def clip_to_tokens(text, token_encoder, max_tokens=AGENT_OUTPUT_TOKEN_LIMIT):
+    return token_encoder.decode(token_encoder.encode(text or "")[:max_tokens])
+
+# Function to stream an agent run only until the coordinator's share of its output is available
+def collect_agent_output_prefix(agent, agent_prompt, token_encoder, max_tokens=AGENT_OUTPUT_TOKEN_LIMIT):
+    output_parts = []
+    output_length = 0
+    response_stream = agent.run(agent_prompt, stream=True)
+    try:
+        for response_chunk in response_stream:
+            if isinstance(response_chunk.content, str):
+                output_parts.append(response_chunk.content)
+                output_length += len(response_chunk.content)
+                # Every token spans at least one character, so only count tokens once the budget could be met;
+                # one token past the budget guarantees the clipped prefix will not change
+                if output_length > max_tokens and len(token_encoder.encode("".join(output_parts))) > max_tokens:
+                    break
+    finally:
+        response_stream.close()
+    return clip_to_tokens("".join(output_parts), token_encoder, max_tokens)
+
+# Function to turn the coordinator's structured response into the report rendered by the result tabs,
+# paired with whether the reply matched the report schema
+def parse_coordinator_report(report_content):
+    # Any pydantic model is dumped and re-validated, so a report built against another copy of the schema still parses
+    if isinstance(report_content, BaseModel):
+        report_content = report_content.model_dump_json()
+
+    # Agno leaves the raw text in place when the reply could not be converted, e.g. on a refusal
+    try:
+        return CoordinatorReport.model_validate_json(report_content or "").model_dump(), True
+    except ValidationError:
+        return {"analysis": str(report_content or ""), "key_points": [], "recommendations": []}, False
 
 # Function to generate comprehensive team analysis
-def generate_team_analysis(analysis_query):
-    legal_advisor_agent, contract_examiner_agent, risk_assessor_agent, analysis_coordinator_agent = initialize_ai_agents()
+def generate_team_analysis(analysis_query, analysis_agents):
+    # Lookups that ask only for a literal (a quoted phrase, a numbered section) are answered by a direct
+    # text scan; if nothing matches, the query falls through to the full agent analysis
+    literal_report = find_literal_matches(st.session_state.document_knowledge_base, analysis_query)
+    if literal_report is not None:
+        return literal_report
+
+    # Serve repeated or paraphrased queries against the active document from the semantic cache
+    query_embedding = get_embedder(os.environ.get("OPENAI_API_KEY")).get_embedding(analysis_query)
+    if query_embedding:
+        cached_report = st.session_state.semantic_cache.lookup(
+            st.session_state.active_document_hash, query_embedding
+        )
+        if cached_report is not None:
+            return cached_report
+
+    legal_advisor_agent, contract_examiner_agent, risk_assessor_agent, analysis_coordinator_agent = analysis_agents
     
     if not all([legal_advisor_agent, contract_examiner_agent, risk_assessor_agent, analysis_coordinator_agent]):
-        return "Error: AI agents not properly initialized. Please ensure a document is uploaded and processed."
+        return {
+            "analysis": "Error: AI agents not properly initialized. Please ensure a document is uploaded and processed.",
+            "key_points": [],
+            "recommendations": [],
+        }
     
-    # Execute agent analysis with focused queries
-    legal_research_output = legal_advisor_agent.run(f"Research legal aspects of: {analysis_query}")
-    contract_analysis_output = contract_examiner_agent.run(f"Analyze contract for: {analysis_query}")
-    risk_assessment_output = risk_assessor_agent.run(f"Assess risks and strategy for: {analysis_query}")
-
-    # Generate comprehensive report
-    comprehensive_report = analysis_coordinator_agent.run(
-        f"Create a concise legal analysis report covering:\n"
-        f"1. Key findings from research\n"
-        f"2. Contract analysis highlights\n" 
-        f"3. Risk assessment summary\n"
-        f"4. Strategic recommendations\n\n"
-        f"Research: {str(legal_research_output)[:500]}...\n"
-        f"Contract: {str(contract_analysis_output)[:500]}...\n"
-        f"Strategy: {str(risk_assessment_output)[:500]}..."
+    token_encoder = get_token_encoder()
+
+    # Execute agent analysis with focused queries; the three runs are independent so they overlap,
+    # and the coordinator starts as soon as the slowest agent has streamed its prefix
+    agent_tasks = {
+        "research": (legal_advisor_agent, f"Research legal aspects of: {analysis_query}"),
+        "contract": (contract_examiner_agent, f"Analyze contract for: {analysis_query}"),
+        "risk": (risk_assessor_agent, f"Assess risks and strategy for: {analysis_query}"),
+    }
+
+    # Retrieve document excerpts once for all three agents instead of letting each search the knowledge base
+    shared_context = retrieve_shared_context(
+        st.session_state.document_knowledge_base,
+        [agent_prompt for _, agent_prompt in agent_tasks.values()]
+    )
+    agent_tasks = {
+        task_name: (agent, f"{agent_prompt}\n\nDocument excerpts:\n{shared_context}")
+        for task_name, (agent, agent_prompt) in agent_tasks.items()
+    }
+    with ThreadPoolExecutor(max_workers=len(agent_tasks)) as agent_executor:
+        agent_futures = {
+            task_name: agent_executor.submit(collect_agent_output_prefix, agent, agent_prompt, token_encoder)
+            for task_name, (agent, agent_prompt) in agent_tasks.items()
+        }
+        agent_outputs = {task_name: future.result() for task_name, future in agent_futures.items()}
+
+    # Generate comprehensive report, key points and recommendations in a single coordinator call
+    coordinator_response = analysis_coordinator_agent.run(
+        COORDINATOR_PROMPT_TEMPLATE.substitute(
+            research=agent_outputs["research"],
+            contract=agent_outputs["contract"],
+            strategy=agent_outputs["risk"]
+        )
     )
+    comprehensive_report, report_is_valid = parse_coordinator_report(coordinator_response.content)
+
+    # Refusals and schema failures are not cached, so the next identical or paraphrased query tries again
+    if query_embedding and report_is_valid:
+        st.session_state.semantic_cache.insert(
+            st.session_state.active_document_hash, query_embedding, comprehensive_report
+        )
     return comprehensive_report
 
 # Main analysis interface
@@ -306,7 +631,7 @@ if st.session_state.document_knowledge_base:
     
     # Show available documents
     if st.session_state.processed_documents:
-        st.info(f"📚 Available Documents: {', '.join(st.session_state.processed_documents)}")
+        st.info(f"📚 Available Documents: {', '.join(st.session_state.processed_documents.values())}")
     
     # Debug information panel
     with st.expander("🔍 Debug: Knowledge Base Details"):
@@ -316,8 +641,9 @@ if st.session_state.document_knowledge_base:
             st.info(f"Search test results: {len(debug_search_results) if debug_search_results else 0}")
             
             # Display vector database information
-            if hasattr(st.session_state.vector_database, 'get_collection'):
-                database_collection = st.session_state.vector_database.get_collection()
+            document_vector_database = st.session_state.document_knowledge_base.vector_db
+            if hasattr(document_vector_database, 'get_collection'):
+                database_collection = document_vector_database.get_collection()
                 if database_collection:
                     collection_count = database_collection.count()
                     st.info(f"Vector DB collection count: {collection_count}")
@@ -361,38 +687,32 @@ if st.session_state.document_knowledge_base:
             st.warning("Please enter a query.")
         else:
             with st.spinner("Analyzing..."):
-                analysis_response = generate_team_analysis(analysis_query_input)
+                analysis_agents = build_agents(os.environ.get("OPENAI_API_KEY"))
+                analysis_response = generate_team_analysis(analysis_query_input, analysis_agents)
 
                 # Display analysis results in organized tabs
                 result_tabs = st.tabs(["Analysis", "Key Points", "Recommendations"])
 
                 with result_tabs[0]:
                     st.subheader("📑 Detailed Analysis")
-                    st.markdown(analysis_response.content if analysis_response.content else "No response generated.")
+                    st.markdown(analysis_response["analysis"] or "No response generated.")
 
                 with result_tabs[1]:
                     st.subheader("📌 Key Points Summary")
-                    # Generate key points summary
-                    _, _, _, team_coordinator = initialize_ai_agents()
-                    if team_coordinator:
-                        key_points_summary = team_coordinator.run(
-                            f"Extract 5 key legal points from: {str(analysis_response.content)[:300]}..."
-                        )
-                        st.markdown(key_points_summary.content if key_points_summary.content else "No summary generated.")
+                    if analysis_response["key_points"]:
+                        st.markdown("\n".join(f"- {key_point}" for key_point in analysis_response["key_points"]))
                     else:
-                        st.error("Team Coordinator agent not available")
+                        st.markdown("No summary generated.")
 
                 with result_tabs[2]:
                     st.subheader("📋 Recommendations")
-                    # Generate recommendations
-                    _, _, _, team_coordinator = initialize_ai_agents()
-                    if team_coordinator:
-                        recommendations_summary = team_coordinator.run(
-                            f"Provide 3 specific legal recommendations from: {str(analysis_response.content)[:300]}..."
-                        )
-                        st.markdown(recommendations_summary.content if recommendations_summary.content else "No recommendations generated.")
+                    if analysis_response["recommendations"]:
+                        st.markdown("\n".join(
+                            f"{index}. {recommendation}"
+                            for index, recommendation in enumerate(analysis_response["recommendations"], start=1)
+                        ))
                     else:
-                        st.error("Team Coordinator agent not available")
+                        st.markdown("No recommendations generated.")
 else:
     st.warning("⚠️ Please upload a PDF document to begin analysis")
     st.info("The AI Legal Team will analyze your document once it's uploaded and processed.")
\ No newline at end of file
@@ -0,0 +1,93 @@
+# Literal text lookups for the AI Legal Document Analyzer
+import re
+
+# Literal references: a quoted phrase, a numbered section or clause, or a roman-numbered article;
+# "Article I" must not match the start of "Article II" or "Article IV"
+LITERAL_QUERY_PATTERN = re.compile(
+    r'"([^"]+)"|\b(?:Section|Clause)\s+\d+(?:\.\d+)*\b|\bArticle\s+[IVXLC]+(?![IVXLC])\b',
+    re.IGNORECASE
+)
+
+# Lookup phrasing allowed around a literal reference, e.g. "Find Section 4.2" or "Where is Article IV?"
+LOOKUP_PREFIX_PATTERN = re.compile(
+    r"^\s*(?:please\s+)?(?:(?:find|show(?:\s+me)?|where\s+is|locate|look\s+up|search\s+for|quote)\s+)?(?:the\s+)?",
+    re.IGNORECASE
+)
+LOOKUP_SUFFIX_PATTERN = re.compile(r"[\s?.!:]*$")
+
+# Characters of surrounding text shown on each side of a literal match, and the most matches shown
+LITERAL_MATCH_CONTEXT = 200
+LITERAL_MATCH_LIMIT = 10
+
+
+# Function to return the literal a query asks for, or None when the query is a question about it
+def extract_literal_query(analysis_query):
+    # "What are the termination risks in Section 12?" mentions a literal but needs the agents,
+    # so only a query that is the literal itself, optionally behind a lookup verb, qualifies
+    literal_query = LOOKUP_PREFIX_PATTERN.sub("", analysis_query, count=1)
+    literal_query = LOOKUP_SUFFIX_PATTERN.sub("", literal_query, count=1)
+    return LITERAL_QUERY_PATTERN.fullmatch(literal_query)
+
+
+# Function to build the pattern that finds a literal in the extracted document text
+def literal_search_pattern(literal_match):
+    # Whitespace may differ between the query and the extracted PDF text; "Section 4.2" must not match
+    # "Section 4.21" or "Section 4.2.1", and "Article I" must not match "Article II"
+    literal_text = literal_match.group(1) or literal_match.group(0)
+    return re.compile(
+        r"\s+".join(re.escape(word) for word in literal_text.split())
+        + ("" if literal_match.group(1) else r"\b(?!\.\d)"),
+        re.IGNORECASE
+    )
+
+
+# Function to answer literal lookups straight from the stored document text, skipping the agents entirely
+def find_literal_matches(knowledge_base, analysis_query):
+    literal_match = extract_literal_query(analysis_query)
+    if not literal_match:
+        return None
+
+    literal_text = literal_match.group(1) or literal_match.group(0)
+    search_pattern = literal_search_pattern(literal_match)
+
+    vector_database = knowledge_base.vector_db
+    document_collection = vector_database.client.get_collection(name=vector_database.collection_name)
+    stored_chunks = document_collection.get(include=["documents", "metadatas"])
+    page_chunks = sorted(
+        zip(stored_chunks["documents"], stored_chunks["metadatas"]),
+        key=lambda chunk: (chunk[1].get("page", 0), chunk[1].get("chunk", 0))
+    )
+
+    literal_matches = []
+    seen_positions = set()
+    chunk_stride = knowledge_base.chunking_strategy.stride
+    for chunk_content, chunk_metadata in page_chunks:
+        for text_match in search_pattern.finditer(chunk_content):
+            # Overlapping chunks repeat text, so identify each match by its offset within the page
+            page_number = chunk_metadata.get("page", 0)
+            page_offset = (chunk_metadata.get("chunk", 1) - 1) * chunk_stride + text_match.start()
+            if (page_number, page_offset) in seen_positions:
+                continue
+            seen_positions.add((page_number, page_offset))
+
+            excerpt_start = max(text_match.start() - LITERAL_MATCH_CONTEXT, 0)
+            excerpt_end = text_match.end() + LITERAL_MATCH_CONTEXT
+            literal_matches.append(
+                f"**Page {page_number}**\n\n> "
+                f"{'...' if excerpt_start > 0 else ''}{chunk_content[excerpt_start:text_match.start()]}"
+                f"**{text_match.group(0)}**"
+                f"{chunk_content[text_match.end():excerpt_end]}{'...' if excerpt_end < len(chunk_content) else ''}"
+            )
+            if len(literal_matches) >= LITERAL_MATCH_LIMIT:
+                break
+        if len(literal_matches) >= LITERAL_MATCH_LIMIT:
+            break
+
+    if not literal_matches:
+        return None
+
+    return {
+        "analysis": f"### Matches for \"{literal_text}\"\n\n" + "\n\n".join(literal_matches),
+        "key_points": [],
+        "recommendations": [],
+    }
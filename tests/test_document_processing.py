@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("agno")
+pytest.importorskip("pypdf")
+
+from agno.document.base import Document
+
+from document_processing import StrideChunking
+
+
+@pytest.mark.parametrize("chunk_size, overlap, expected_overlap", [
+    (1000, 200, 200),
+    (1000, 500, 500),
+    (1000, 1000, 500),
+    (100, 200, 50),
+    (1, 1, 0),
+])
+def test_overlap_is_capped_at_half_a_chunk(chunk_size, overlap, expected_overlap):
+    chunking_strategy = StrideChunking(chunk_size=chunk_size, overlap=overlap)
+    assert chunking_strategy.overlap == expected_overlap
+    assert chunking_strategy.stride == chunk_size - expected_overlap
+
+
+def test_oversized_overlap_does_not_multiply_chunks():
+    page_text = " ".join(f"word{index}" for index in range(600))
+    chunked_documents = StrideChunking(chunk_size=100, overlap=200).chunk(
+        Document(name="contract", id="contract_1", meta_data={"page": 1}, content=page_text)
+    )
+
+    # Every character lands in at most two chunks
+    assert len(chunked_documents) <= 2 * len(page_text) // 100 + 1
+    assert sum(len(document.content) for document in chunked_documents) <= 2 * len(page_text)
+    assert chunked_documents[0].content == page_text[:100]
+    assert chunked_documents[1].content.startswith(page_text[50:100])
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+import pytest
+
+from literal_lookup import extract_literal_query, find_literal_matches, literal_search_pattern
+
+
+# Knowledge base stand-in exposing only what find_literal_matches reads from Agno and Chroma
+def make_knowledge_base(page_texts, chunk_stride=1000):
+    stored_chunks = {
+        "documents": list(page_texts),
+        "metadatas": [{"page": page_number, "chunk": 1} for page_number in range(1, len(page_texts) + 1)],
+    }
+    document_collection = SimpleNamespace(get=lambda include: stored_chunks)
+    return SimpleNamespace(
+        vector_db=SimpleNamespace(
+            collection_name="legal_docs_test",
+            client=SimpleNamespace(get_collection=lambda name: document_collection),
+        ),
+        chunking_strategy=SimpleNamespace(stride=chunk_stride),
+    )
+
+
+@pytest.mark.parametrize("analysis_query, literal_text", [
+    ("Section 4.2", "Section 4.2"),
+    ("Find Section 12", "Section 12"),
+    ("show me clause 7.1.3.", "clause 7.1.3"),
+    ("Where is Article IV?", "Article IV"),
+    ('Locate the "force majeure"', "force majeure"),
+    ('"governing law"', "governing law"),
+])
+def test_extract_literal_query_accepts_bare_lookups(analysis_query, literal_text):
+    literal_match = extract_literal_query(analysis_query)
+    assert literal_match is not None
+    assert (literal_match.group(1) or literal_match.group(0)) == literal_text
+
+
+@pytest.mark.parametrize("analysis_query", [
+    "What are the termination risks in Section 12?",
+    'Explain what "force majeure" means for the supplier',
+    "Summarize Article II and its obligations",
+    "Identify potential legal risks in this contract",
+    "Article IIX1",
+])
+def test_extract_literal_query_rejects_questions(analysis_query):
+    assert extract_literal_query(analysis_query) is None
+
+
+@pytest.mark.parametrize("analysis_query, document_text, expected", [
+    ("Article I", "see Article I.", True),
+    ("Article I", "see Article II.", False),
+    ("Article I", "see Article IV.", False),
+    ("Section 4.2", "under Section 4.2, the", True),
+    ("Section 4.2", "under Section  4.2\nthe", True),
+    ("Section 4.2", "under Section 4.21", False),
+    ("Section 4.2", "under Section 4.2.1", False),
+    ('"net 30 days"', "payment is due net\n30 days after", True),
+])
+def test_literal_search_pattern(analysis_query, document_text, expected):
+    search_pattern = literal_search_pattern(extract_literal_query(analysis_query))
+    assert bool(search_pattern.search(document_text)) is expected
+
+
+def test_find_literal_matches_reports_each_page():
+    knowledge_base = make_knowledge_base([
+        "Article II sets out the fees.",
+        "Article I defines the parties.",
+        "As stated in Article I, the parties agree.",
+    ])
+
+    literal_report = find_literal_matches(knowledge_base, "Find Article I")
+
+    assert literal_report["analysis"].startswith('### Matches for "Article I"')
+    assert "**Page 1**" not in literal_report["analysis"]
+    assert "**Page 2**" in literal_report["analysis"]
+    assert "**Page 3**" in literal_report["analysis"]
+    assert literal_report["key_points"] == []
+    assert literal_report["recommendations"] == []
+
+
+def test_find_literal_matches_falls_through():
+    knowledge_base = make_knowledge_base(["Section 12 covers termination."])
+
+    assert find_literal_matches(knowledge_base, "What are the termination risks in Section 12?") is None
+    assert find_literal_matches(knowledge_base, "Section 13") is None